@@ -1,34 +1,120 @@
 import os
-import tempfile
+
+from gevent import monkey
+
+if os.environ.get('GEVENT_MONKEY_PATCH', '1') != '0':  # Tests import the app into an already running interpreter
+    monkey.patch_all()  # Must run before anything imports socket/ssl/threading so yt-dlp and ACRCloud I/O cooperate
+
+import re
+import concurrent.futures
 import logging
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from array import array
+from contextlib import closing
+import requests
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
+from diskcache import Cache
+from gevent.threadpool import ThreadPoolExecutor
+from tenacity import retry, retry_if_result, stop_after_attempt, wait_exponential
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from pytube import YouTube
-from pytube.exceptions import (
-    VideoUnavailable,
-    AgeRestrictedError,
-    MembersOnly,
-    RecordingUnavailable,
-    VideoPrivate,
-    LiveStreamError,
-    PytubeError  # Generic Pytube exception
-)
-from acrcloud.recognizer import ACRCloudRecognizer  # Corrected import
-import json
-import urllib.error  # Explicit import for checking HTTPError
+import yt_dlp
+from yt_dlp.networking.exceptions import HTTPError as YtDlpHTTPError
+from yt_dlp.utils import DownloadError, ExtractorError, GeoRestrictedError
+from acrcloud.recognizer import ACRCloudRecognizer, ACRCloudStatusCode  # Corrected import
+import orjson
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class OrjsonProvider(JSONProvider):
+    # Routes jsonify() and request.get_json() through orjson instead of the stdlib json module.
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for all routes
 
+# Compiled once at import; the 'vid' group gives the 11-char video id without running the extractor.
+YOUTUBE_URL_RE = re.compile(
+    r'^(?:https?://)?(?:www\.|m\.|music\.)?(?:youtube\.com/(?:watch\?(?:[^#\s]*&)?v=|shorts/|embed/|live/)|youtu\.be/)'
+    r'(?P<vid>[A-Za-z0-9_-]{11})'
+    r'(?:[&?#]\S*)?$')
+
+# Resolved audio formats keyed by video id, so repeat requests skip the yt-dlp extraction.
+# Signed stream URLs stay valid for hours; 5 minutes is well inside that.
+audio_format_cache = TTLCache(maxsize=1024, ttl=300)
+audio_format_cache_lock = threading.Lock()
+
+YDL_OPTIONS = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'noplaylist': True, 'socket_timeout': 10}
+# One YoutubeDL per process: it keeps its HTTP connection pool and the YouTube extractor's parsed player/signature
+# cache between requests instead of rebuilding them for every extraction.
+ydl = yt_dlp.YoutubeDL(YDL_OPTIONS)
+
+# Video ids that recently failed as unavailable/private/etc., so repeat requests skip the YouTube round-trip.
+unavailable_video_cache = TTLCache(maxsize=1024, ttl=600)
+unavailable_video_cache_lock = threading.Lock()
+# yt-dlp raises most per-video failures as "expected" ExtractorErrors, including YouTube throttling this server, so only
+# these reasons are treated as a property of the video. Throttling markers are checked first and never cached.
+YOUTUBE_UNAVAILABLE_MARKERS = ('video unavailable', 'private video', 'members', 'confirm your age', 'has been removed',
+                               'no longer available')
+YOUTUBE_RATE_LIMIT_MARKERS = ('rate-limited', 'try again later')
+YOUTUBE_BOT_CHECK_MARKERS = ('not a bot', 'captcha')
+
+# ACRCloud only fingerprints the first 12 seconds, so fetch a leading byte range instead of the whole track.
+# 512 KiB covers 12s of audio up to ~320 kbit/s plus container headers; the larger range is a retry for streams it
+# fails to decode.
+AUDIO_RANGE_STEPS = (512 * 1024, 2 * 1024 * 1024)
+ACR_UNDECODABLE_CODES = (2004, 2006)  # Gen Fingerprint Error, Decode Audio Error
+
+# YouTube HTTP status -> (response status, error message template)
+HTTP_ERROR_MAP = {
+    400: (502, 'YouTube API Bad Request (HTTP 400): {error}'),
+    403: (502, 'YouTube API Forbidden (HTTP 403): {error}'),
+    429: (429, 'Rate limited by YouTube (HTTP 429). Please try again later.'),
+}
+DEFAULT_HTTP_ERROR = (502, 'YouTube API Error (HTTP {status}): {error}')
+
+# Shared across requests so connections to googlevideo.com are kept alive instead of paying a TLS handshake per fetch.
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=50, pool_maxsize=50))
+
+# Recognition responses keyed by video id, on disk so they survive restarts and are shared by gunicorn workers.
+# Matches are kept for a week; "no result" only for an hour so newly added tracks in ACRCloud's DB get picked up.
+acr_result_cache = Cache(os.environ.get('ACR_CACHE_DIR', '.cache/acr'), size_limit=2 << 30)
+ACR_MATCH_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+ACR_NO_RESULT_CACHE_TTL = 60 * 60  # seconds
+
+# Optional local pre-filter, enabled when Chromaprint's fpcalc is installed: the same song uploaded under another
+# video id is matched against fingerprints of earlier ACRCloud hits instead of spending another ACRCloud call.
+FPCALC_PATH = shutil.which('fpcalc')
+FINGERPRINT_DB_PATH = os.environ.get('FINGERPRINT_DB', '.cache/fingerprints.sqlite3')
+FINGERPRINT_MAX_BER = 0.35  # Bit error rate below which two fingerprints are the same recording (as in AcoustID)
+FINGERPRINT_MAX_SHIFT = 8  # Alignment slack either way, in fingerprint items (~1 second)
+FINGERPRINT_CANDIDATES = 5  # Stored fingerprints sharing the most items that get the full BER comparison
+
 # ACRCloud Configuration
 acr_config_details = {
     'host': os.environ.get('ACR_CLOUD_HOST') or os.environ.get('ACR_HOST'),
     'access_key': os.environ.get('ACR_CLOUD_ACCESS_KEY') or os.environ.get('ACR_ACCESS_KEY'),
     'access_secret': os.environ.get('ACR_CLOUD_ACCESS_SECRET') or os.environ.get('ACR_ACCESS_SECRET'),
-    'timeout': 10  # seconds
+    'timeout': 4  # seconds; transient failures are retried instead of waited out
 }
 
 acr_recognizer = None
@@ -42,137 +128,398 @@ else:
     except Exception as e:
         logging.error(f"Failed to initialize ACRCloud Recognizer: {e}")
 
+# The SDK's fingerprinting is a blocking C call, so recognition runs on real OS threads (gevent's pool keeps the hub
+# free while waiting). Workers match ACRCloud's concurrent-call quota; the slots cap how many requests may queue for
+# them before new ones are turned away.
+acr_recognition_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('ACR_CONCURRENCY', '8')))
+acr_recognition_slots = threading.BoundedSemaphore(int(os.environ.get('ACR_QUEUE_LIMIT', '32')))
+ACR_RESULT_TIMEOUT = 30  # seconds
+acr_thread_local = threading.local()
+# The SDK never raises: network failures and timeouts come back as its own locally built 3000 "Http Error" JSON.
+# A 4xx from ACRCloud (bad credentials, exhausted quota) lands there too but will not succeed on a retry.
+ACR_CLIENT_ERROR_RE = re.compile(r'HTTP Error 4\d\d')
+
 
 def map_acr_match_to_soundtrace_format(acr_match):
-    spotify_data = acr_match.get('external_metadata', {}).get('spotify', {})
-    spotify_artist_id = spotify_data.get('artists', [{}])[0].get('id') if spotify_data.get('artists') else None
-    spotify_track_id = spotify_data.get('track', {}).get('id') if spotify_data.get('track') else None
+    # Called once per ACRCloud match; acr_match.get is bound once and each nested dict is walked only once.
+    get = acr_match.get
+    external_metadata = get('external_metadata') or {}
+    spotify_data = external_metadata.get('spotify') or {}
+    youtube_data = external_metadata.get('youtube') or {}
 
-    youtube_data = acr_match.get('external_metadata', {}).get('youtube', {})
-    youtube_video_id = youtube_data.get('vid') if youtube_data else None
+    spotify_artist_id = ((spotify_data.get('artists') or [{}])[0] or {}).get('id')
+    spotify_track_id = (spotify_data.get('track') or {}).get('id')
+    youtube_video_id = youtube_data.get('vid')
 
     return {
-        'id': acr_match.get('acrid'),
-        'title': acr_match.get('title', 'Unknown Title'),
-        'artist': ', '.join(
-            [artist.get('name', 'Unknown Artist') for artist in acr_match.get('artists', [])]) or 'Unknown Artist',
-        'album': acr_match.get('album', {}).get('name', 'Unknown Album'),
-        'releaseDate': acr_match.get('release_date', 'N/A'),
-        'matchConfidence': acr_match.get('score', 0),
+        'id': get('acrid'),
+        'title': get('title', 'Unknown Title'),
+        'artist': ', '.join(artist.get('name', 'Unknown Artist') for artist in (get('artists') or ())) or 'Unknown Artist',
+        'album': (get('album') or {}).get('name', 'Unknown Album'),
+        'releaseDate': get('release_date', 'N/A'),
+        'matchConfidence': get('score', 0),
         'spotifyArtistId': spotify_artist_id,
         'spotifyTrackId': spotify_track_id,
         'youtubeVideoId': youtube_video_id,
-        'youtubeVideoTitle': acr_match.get('title'),
+        'youtubeVideoTitle': get('title'),
         'platformLinks': {
-            'spotify': f"https://open.spotify.com/track/{spotify_track_id}" if spotify_track_id else None,
-            'youtube': f"https://www.youtube.com/watch?v={youtube_video_id}" if youtube_video_id else None,
+            'spotify': 'https://open.spotify.com/track/' + spotify_track_id if spotify_track_id else None,
+            'youtube': 'https://www.youtube.com/watch?v=' + youtube_video_id if youtube_video_id else None,
         }
     }
 
 
+def get_acr_recognizer():
+    # One recognizer per recognition thread, so concurrent fingerprinting never shares an SDK object.
+    recognizer = getattr(acr_thread_local, 'recognizer', None)
+    if recognizer is None:
+        recognizer = ACRCloudRecognizer(acr_config_details)
+        acr_thread_local.recognizer = recognizer
+    return recognizer
+
+
+def is_transient_acr_error(result):
+    status = orjson.loads(result).get('status') or {}
+    return (status.get('code') == ACRCloudStatusCode.HTTP_ERROR_CODE
+            and not ACR_CLIENT_ERROR_RE.search(status.get('msg') or ''))
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.25, max=1.0),
+       retry=retry_if_result(is_transient_acr_error),
+       retry_error_callback=lambda retry_state: retry_state.outcome.result())
+def recognize_in_worker(audio_data):
+    return get_acr_recognizer().recognize_by_filebuffer(audio_data, 0, 12)
+
+
+def recognize_audio(audio_data):
+    # Returns ACRCloud's raw JSON response, or None when the recognition queue is full.
+    if not acr_recognition_slots.acquire(blocking=False):
+        return None
+    try:
+        future = acr_recognition_pool.submit(recognize_in_worker, audio_data)
+    except BaseException:
+        acr_recognition_slots.release()
+        raise
+    # The slot is held until the worker finishes, not until we stop waiting, so timed-out calls still count.
+    future.add_done_callback(lambda _: acr_recognition_slots.release())
+    return future.result(timeout=ACR_RESULT_TIMEOUT)
+
+
+def pick_audio_format(formats):
+    # Audio-only format with the bitrate closest to 128 kbit/s: plenty for fingerprinting and cheap to fetch.
+    audio_formats = [fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none'
+                     and fmt.get('url') and fmt.get('protocol') in ('https', 'http')]
+    return min(audio_formats, key=lambda fmt: abs((fmt.get('abr') or 128) - 128), default=None)
+
+
+def download_audio_prefix(audio_format, num_bytes):
+    # Reads at most num_bytes from the start of the stream into memory for recognize_by_filebuffer, then drops the
+    # connection, in case the server ignores the Range header and starts sending the whole file.
+    audio_buffer = bytearray()
+    headers = {**(audio_format.get('http_headers') or {}), 'Range': f'bytes=0-{num_bytes - 1}'}
+    with http_session.get(audio_format['url'], headers=headers, stream=True, timeout=20) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            audio_buffer += chunk
+            if len(audio_buffer) >= num_bytes:
+                break
+    return bytes(audio_buffer[:num_bytes])
+
+
+def youtube_http_error_response(youtube_url, http_status, e):
+    response_status, error_template = HTTP_ERROR_MAP.get(http_status, DEFAULT_HTTP_ERROR)
+    logging.error(f"HTTP Error {http_status} from YouTube for {youtube_url}: {str(e)}", exc_info=True)
+    return jsonify({'error': error_template.format(status=http_status, error=str(e)),
+                    'acrCode': 9000 + http_status,  # Custom acrCode based on HTTP status
+                    'acrResponse': str(e)}), response_status
+
+
+def init_fingerprint_db():
+    os.makedirs(os.path.dirname(FINGERPRINT_DB_PATH) or '.', exist_ok=True)
+    with closing(sqlite3.connect(FINGERPRINT_DB_PATH, timeout=5)) as connection, connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS fingerprints (video_id TEXT PRIMARY KEY, fingerprint BLOB NOT NULL, '
+                           'created_at REAL NOT NULL DEFAULT 0)')
+        connection.execute('CREATE TABLE IF NOT EXISTS fingerprint_items (item INTEGER NOT NULL, video_id TEXT NOT NULL)')
+        if 'created_at' not in {column[1] for column in connection.execute('PRAGMA table_info(fingerprints)')}:
+            # Databases from before rows expired; their rows count as already expired
+            connection.execute('ALTER TABLE fingerprints ADD COLUMN created_at REAL NOT NULL DEFAULT 0')
+        connection.execute('CREATE INDEX IF NOT EXISTS fingerprints_created_at ON fingerprints (created_at)')
+        connection.execute('CREATE INDEX IF NOT EXISTS fingerprint_items_item ON fingerprint_items (item)')
+        connection.execute('CREATE INDEX IF NOT EXISTS fingerprint_items_video_id ON fingerprint_items (video_id)')
+
+
+def compute_fingerprint(audio_data):
+    # Raw Chromaprint items for the first 12 seconds of audio_data, or None if fpcalc is missing or fails.
+    if not FPCALC_PATH:
+        return None
+    try:
+        result = subprocess.run([FPCALC_PATH, '-raw', '-length', '12', '-'], input=audio_data, capture_output=True,
+                                timeout=10, check=True)
+    except (subprocess.SubprocessError, OSError) as e:
+        logging.warning(f"fpcalc failed: {e}")
+        return None
+    for line in result.stdout.decode(errors='replace').splitlines():
+        if line.startswith('FINGERPRINT='):
+            # Some fpcalc builds print items as signed ints; store them all as unsigned 32-bit
+            return [int(item) & 0xFFFFFFFF for item in line[len('FINGERPRINT='):].split(',') if item] or None
+    return None
+
+
+def fingerprint_bit_error_rate(fingerprint, other):
+    # Lowest fraction of differing bits over alignments within FINGERPRINT_MAX_SHIFT items of each other.
+    min_overlap = min(len(fingerprint), len(other)) // 2
+    best_rate = 1.0
+    for shift in range(-FINGERPRINT_MAX_SHIFT, FINGERPRINT_MAX_SHIFT + 1):
+        pairs = list(zip(fingerprint[max(shift, 0):], other[max(-shift, 0):]))
+        if not pairs or len(pairs) < min_overlap:
+            continue
+        bit_errors = sum(bin(item ^ other_item).count('1') for item, other_item in pairs)
+        best_rate = min(best_rate, bit_errors / (32 * len(pairs)))
+    return best_rate
+
+
+def find_fingerprint_match(fingerprint):
+    # Video id of a stored fingerprint for the same recording, or None.
+    items = list(set(fingerprint))
+    with closing(sqlite3.connect(FINGERPRINT_DB_PATH, timeout=5)) as connection:
+        # Exact shared items narrow the search; only the best few candidates get the shift-tolerant comparison.
+        candidates = connection.execute(
+            f"SELECT video_id FROM fingerprint_items WHERE item IN ({','.join('?' * len(items))}) "
+            "GROUP BY video_id ORDER BY COUNT(*) DESC LIMIT ?", (*items, FINGERPRINT_CANDIDATES)).fetchall()
+        for (candidate_id,) in candidates:
+            row = connection.execute('SELECT fingerprint FROM fingerprints WHERE video_id = ?', (candidate_id,)).fetchone()
+            if not row:
+                continue
+            stored_fingerprint = array('I')
+            stored_fingerprint.frombytes(row[0])
+            if fingerprint_bit_error_rate(fingerprint, stored_fingerprint) < FINGERPRINT_MAX_BER:
+                return candidate_id
+    return None
+
+
+def store_fingerprint(video_id, fingerprint):
+    now = time.time()
+    with closing(sqlite3.connect(FINGERPRINT_DB_PATH, timeout=5)) as connection, connection:
+        # A row older than ACR_MATCH_CACHE_TTL has outlived the cached response it points at, so it can never be served.
+        expired_before = now - ACR_MATCH_CACHE_TTL
+        connection.execute('DELETE FROM fingerprint_items WHERE video_id IN '
+                           '(SELECT video_id FROM fingerprints WHERE created_at < ?)', (expired_before,))
+        connection.execute('DELETE FROM fingerprints WHERE created_at < ?', (expired_before,))
+        connection.execute('INSERT OR REPLACE INTO fingerprints (video_id, fingerprint, created_at) VALUES (?, ?, ?)',
+                           (video_id, array('I', fingerprint).tobytes(), now))
+        connection.execute('DELETE FROM fingerprint_items WHERE video_id = ?', (video_id,))
+        connection.executemany('INSERT INTO fingerprint_items VALUES (?, ?)',
+                               ((item, video_id) for item in set(fingerprint)))
+
+
+def delete_fingerprint(video_id):
+    with closing(sqlite3.connect(FINGERPRINT_DB_PATH, timeout=5)) as connection, connection:
+        connection.execute('DELETE FROM fingerprints WHERE video_id = ?', (video_id,))
+        connection.execute('DELETE FROM fingerprint_items WHERE video_id = ?', (video_id,))
+
+
+def lookup_fingerprint_response(video_id, fingerprint):
+    # Cached ACRCloud response of an earlier video with the same audio, also cached under video_id; None on a miss.
+    if not fingerprint:
+        return None
+    try:
+        for _ in range(FINGERPRINT_CANDIDATES):
+            matched_video_id = find_fingerprint_match(fingerprint)
+            if matched_video_id is None:
+                return None
+            matched_response = acr_result_cache.get(matched_video_id)  # Gone once its ACR_MATCH_CACHE_TTL has passed
+            if matched_response is not None and matched_video_id != video_id:
+                break
+            # Without a cached response the row can never be served again; drop it so the next candidate gets a turn.
+            delete_fingerprint(matched_video_id)
+        else:
+            return None
+    except sqlite3.Error as e:
+        logging.warning(f"Fingerprint lookup failed for video id {video_id}: {e}")
+        return None
+    logging.info(f"Fingerprint of video id {video_id} matches video id {matched_video_id}, skipping ACRCloud")
+    acr_result_cache.set(video_id, matched_response, expire=ACR_MATCH_CACHE_TTL)
+    return matched_response
+
+
+if FPCALC_PATH:
+    try:
+        init_fingerprint_db()
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"Fingerprint database {FINGERPRINT_DB_PATH} unavailable, fingerprint pre-filter disabled: {e}")
+        FPCALC_PATH = None  # compute_fingerprint() then returns None and every request goes to ACRCloud
+
+
+def acr_success_response(youtube_url, video_id, scan_results, acr_status_code, acr_status_msg):
+    matches = [map_acr_match_to_soundtrace_format(music_item) for music_item in
+               scan_results.get('metadata', {}).get('music', [])]
+    logging.info(f"ACRCloud success for {youtube_url}. Matches found: {len(matches)}")
+    response_data = {'matches': matches, 'acrCode': acr_status_code, 'acrResponse': acr_status_msg}
+    acr_result_cache.set(video_id, response_data, expire=ACR_MATCH_CACHE_TTL)
+    return jsonify(response_data), 200
+
+
+def acr_no_result_response(youtube_url, video_id, scan_results, acr_status_code, acr_status_msg):
+    logging.info(f"ACRCloud no result for {youtube_url}.")
+    response_data = {'matches': [], 'acrCode': acr_status_code, 'acrResponse': acr_status_msg}
+    acr_result_cache.set(video_id, response_data, expire=ACR_NO_RESULT_CACHE_TTL)
+    return jsonify(response_data), 200
+
+
+def acr_error_response(youtube_url, video_id, scan_results, acr_status_code, acr_status_msg):
+    logging.error(f"ACRCloud error for {youtube_url}. Code: {acr_status_code}, Msg: {acr_status_msg}")
+    return jsonify(
+        {'error': f"ACRCloud recognition error: {acr_status_msg}", 'matches': [], 'acrCode': acr_status_code,
+         'acrResponse': acr_status_msg}), 500
+
+
+# ACRCloud status code -> response builder; any other code is an error
+ACR_STATUS_HANDLERS = {
+    0: acr_success_response,  # Success
+    1001: acr_no_result_response,  # No result
+}
+
+
+def classify_extractor_error(error):
+    # 'unavailable', 'rate_limited', 'bot_check' or None for an ExtractorError raised while resolving a video.
+    if isinstance(error, GeoRestrictedError):
+        return 'unavailable'
+    reason = str(error).lower()
+    if any(marker in reason for marker in YOUTUBE_RATE_LIMIT_MARKERS):
+        return 'rate_limited'
+    if any(marker in reason for marker in YOUTUBE_BOT_CHECK_MARKERS):
+        return 'bot_check'
+    if error.expected and any(marker in reason for marker in YOUTUBE_UNAVAILABLE_MARKERS):
+        return 'unavailable'
+    return None
+
+
+def parse_youtube_url_request(req):
+    # Returns (url, video_id, None) or (None, None, (error_message, status_code)).
+    data = req.get_json(silent=True)
+    url = data.get('url') if isinstance(data, dict) else None
+    if not url:
+        return None, None, ("Missing 'url' in JSON payload", 400)
+    url_match = YOUTUBE_URL_RE.fullmatch(url) if isinstance(url, str) else None
+    if not url_match:
+        return None, None, ('Invalid YouTube URL', 400)
+    return url, url_match['vid'], None
+
+
 @app.route('/api/process-youtube-url', methods=['POST'])
 def process_youtube_url():
-    logging.info("Received request for /api/process-youtube-url")
-    data = request.get_json()
-    if not data or 'url' not in data:
-        logging.error("Request missing 'url' in JSON payload")
-        return jsonify({'error': "Missing 'url' in JSON payload"}), 400
+    youtube_url, video_id, url_error = parse_youtube_url_request(request)
+    if url_error:
+        error_message, status_code = url_error
+        logging.error(f"Rejected request: {error_message}")
+        return jsonify({'error': error_message}), status_code
+    logging.info(f"Processing URL: {youtube_url} (video id: {video_id})")
+
+    with unavailable_video_cache_lock:
+        unavailable_reason = unavailable_video_cache.get(video_id)
+    if unavailable_reason is not None:
+        logging.debug("Video id %s recently failed as unavailable: %s", video_id, unavailable_reason)
+        return jsonify(
+            {'error': f'YouTube video error: {unavailable_reason}', 'acrCode': 9001, 'acrResponse': unavailable_reason}), 404
 
-    youtube_url = data['url']
-    logging.info(f"Processing URL: {youtube_url}")
+    cached_response = acr_result_cache.get(video_id)
+    if cached_response is not None:
+        logging.debug("Returning cached ACRCloud result for video id %s", video_id)
+        return jsonify(cached_response), 200
 
     if not acr_recognizer:
         logging.error("ACRCloud recognizer not initialized due to missing config.")
         return jsonify({'error': 'ACRCloud service not configured on server.'}), 500
 
-    temp_file_path = None
     try:
         # 1. Download YouTube audio
-        # Removed 'headers' argument as it's not supported directly
-        yt = YouTube(youtube_url, use_oauth=False, allow_oauth_cache=False)
-
-        audio_stream = yt.streams.filter(only_audio=True, abr='128kbps').first()
-        if not audio_stream:
-            audio_stream = yt.streams.filter(only_audio=True).first()
-
-        if not audio_stream:
-            logging.error(f"No audio stream found for URL: {youtube_url}")
-            return jsonify({'error': 'No audio stream found for the given YouTube URL.'}), 404
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{audio_stream.subtype or 'mp4'}") as tmpfile:
-            temp_file_path = tmpfile.name
-            logging.info(
-                f"Downloading audio for {youtube_url} to {temp_file_path} (subtype: {audio_stream.subtype}, type: {audio_stream.type})")
-            audio_stream.download(output_path=os.path.dirname(temp_file_path),
-                                  filename=os.path.basename(temp_file_path))
-        logging.info(f"Download complete: {temp_file_path}, size: {os.path.getsize(temp_file_path)}")
-
-        # 2. Send to ACRCloud
-        logging.info(f"Starting ACRCloud recognition for {temp_file_path}")
-        scan_results_json_string = acr_recognizer.recognize_by_file(temp_file_path, start_seconds=0, rec_length=12)
-        logging.info(f"ACRCloud raw response (first 500 chars): {scan_results_json_string[:500]}...")
-
-        scan_results = json.loads(scan_results_json_string)
-        acr_status_code = scan_results.get('status', {}).get('code', -1)
-        acr_status_msg = scan_results.get('status', {}).get('msg', 'Unknown ACRCloud status')
-
-        if acr_status_code == 0:  # Success
-            matches = [map_acr_match_to_soundtrace_format(music_item) for music_item in
-                       scan_results.get('metadata', {}).get('music', [])]
-            logging.info(f"ACRCloud success for {youtube_url}. Matches found: {len(matches)}")
-            return jsonify({'matches': matches, 'acrCode': acr_status_code, 'acrResponse': acr_status_msg}), 200
-        elif acr_status_code == 1001:  # No result
-            logging.info(f"ACRCloud no result for {youtube_url}.")
-            return jsonify({'matches': [], 'acrCode': acr_status_code, 'acrResponse': acr_status_msg}), 200
-        else:  # Other ACRCloud error
-            logging.error(f"ACRCloud error for {youtube_url}. Code: {acr_status_code}, Msg: {acr_status_msg}")
-            return jsonify(
-                {'error': f"ACRCloud recognition error: {acr_status_msg}", 'matches': [], 'acrCode': acr_status_code,
-                 'acrResponse': acr_status_msg}), 500
+        with audio_format_cache_lock:
+            audio_format = audio_format_cache.get(video_id)
 
-    except (
-    VideoUnavailable, AgeRestrictedError, MembersOnly, RecordingUnavailable, VideoPrivate, LiveStreamError) as e_pytube:
-        logging.error(f"Pytube - Video specific error for {youtube_url}: {str(e_pytube)}", exc_info=False)
-        return jsonify(
-            {'error': f'YouTube video error: {str(e_pytube)}', 'acrCode': 9001, 'acrResponse': str(e_pytube)}), 404
-    except PytubeError as e_pytube_generic:
-        logging.error(f"Pytube - Generic error for {youtube_url}: {str(e_pytube_generic)}", exc_info=True)
-        return jsonify({'error': f'YouTube library error: {str(e_pytube_generic)}', 'acrCode': 9002,
-                        'acrResponse': str(e_pytube_generic)}), 500
+        if audio_format:
+            logging.debug("Using cached audio format for video id %s", video_id)
+        else:
+            # Extract from the canonical watch URL so shorts/embed/scheme-less forms all behave the same
+            info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
+
+            audio_format = pick_audio_format(info.get('formats') or [])
+            if not audio_format:
+                logging.error(f"No audio stream found for URL: {youtube_url}")
+                return jsonify({'error': 'No audio stream found for the given YouTube URL.'}), 404
+
+            with audio_format_cache_lock:
+                audio_format_cache[video_id] = audio_format
+
+        audio_fingerprint = None
+        for range_bytes in AUDIO_RANGE_STEPS:
+            logging.debug("Downloading first %d bytes of audio for %s (ext: %s, abr: %s)",
+                          range_bytes, youtube_url, audio_format.get('ext'), audio_format.get('abr'))
+            audio_data = download_audio_prefix(audio_format, range_bytes)
+            logging.debug("Download complete for %s, size: %d", youtube_url, len(audio_data))
+
+            if audio_fingerprint is None:
+                audio_fingerprint = compute_fingerprint(audio_data)
+                fingerprint_response = lookup_fingerprint_response(video_id, audio_fingerprint)
+                if fingerprint_response is not None:
+                    return jsonify(fingerprint_response), 200
+
+            # 2. Send to ACRCloud
+            scan_results_json_string = recognize_audio(audio_data)
+            if scan_results_json_string is None:
+                logging.error(f"ACRCloud recognition queue full, rejecting {youtube_url}")
+                return jsonify({'error': 'Recognition service is busy. Please try again later.'}), 503
+            if logging.getLogger().isEnabledFor(logging.DEBUG):  # Skip building the preview slice otherwise
+                logging.debug("ACRCloud raw response (first 500 chars): %s...", scan_results_json_string[:500])
+
+            scan_results = orjson.loads(scan_results_json_string)
+            acr_status = scan_results.get('status') or {}
+            # Retry with a bigger range only if the audio was cut short; a complete stream will not decode any better.
+            if acr_status.get('code') not in ACR_UNDECODABLE_CODES or len(audio_data) < range_bytes:
+                break
+
+        acr_status_code = acr_status.get('code', -1)
+        acr_status_msg = acr_status.get('msg', 'Unknown ACRCloud status')
+        if acr_status_code == 0 and audio_fingerprint:
+            try:
+                store_fingerprint(video_id, audio_fingerprint)
+            except sqlite3.Error as e:
+                logging.warning(f"Storing fingerprint failed for video id {video_id}: {e}")
+
+        status_handler = ACR_STATUS_HANDLERS.get(acr_status_code, acr_error_response)
+        return status_handler(youtube_url, video_id, scan_results, acr_status_code, acr_status_msg)
+
+    except DownloadError as e_ytdlp:
+        cause = e_ytdlp.exc_info[1] if e_ytdlp.exc_info else None
+        error_kind = classify_extractor_error(cause) if isinstance(cause, ExtractorError) else None
+        if error_kind == 'unavailable':  # Unavailable, private, members-only, geo-blocked...
+            logging.error(f"yt-dlp - Video specific error for {youtube_url}: {str(e_ytdlp)}", exc_info=False)
+            with unavailable_video_cache_lock:
+                unavailable_video_cache[video_id] = str(e_ytdlp)
+            return jsonify(
+                {'error': f'YouTube video error: {str(e_ytdlp)}', 'acrCode': 9001, 'acrResponse': str(e_ytdlp)}), 404
+        if error_kind == 'rate_limited':  # Throttles this server, not the video: never negative-cached
+            logging.warning(f"yt-dlp - Rate limited by YouTube for {youtube_url}: {str(e_ytdlp)}")
+            return jsonify({'error': 'Rate limited by YouTube. Please try again later.', 'acrCode': 9429,
+                            'acrResponse': str(e_ytdlp)}), 429
+        if error_kind == 'bot_check':
+            logging.warning(f"yt-dlp - YouTube bot check for {youtube_url}: {str(e_ytdlp)}")
+            return jsonify({'error': 'YouTube is temporarily blocking requests from this server.', 'acrCode': 9503,
+                            'acrResponse': str(e_ytdlp)}), 503
+        if isinstance(cause, ExtractorError) and isinstance(cause.cause, YtDlpHTTPError):
+            return youtube_http_error_response(youtube_url, cause.cause.status, e_ytdlp)
+        logging.error(f"yt-dlp - Generic error for {youtube_url}: {str(e_ytdlp)}", exc_info=True)
+        return jsonify({'error': f'YouTube library error: {str(e_ytdlp)}', 'acrCode': 9002,
+                        'acrResponse': str(e_ytdlp)}), 500
+    except requests.HTTPError as e_http:  # From the ranged audio fetch
+        with audio_format_cache_lock:  # The signed URL may have expired or been revoked; re-extract next time
+            audio_format_cache.pop(video_id, None)
+        return youtube_http_error_response(youtube_url, e_http.response.status_code, e_http)
+    except concurrent.futures.TimeoutError as e_timeout:  # ACRCloud recognition exceeded ACR_RESULT_TIMEOUT
+        logging.error(f"ACRCloud recognition timed out for {youtube_url}", exc_info=False)
+        return jsonify({'error': 'ACRCloud recognition timed out.', 'acrCode': 9504, 'acrResponse': str(e_timeout)}), 504
     except Exception as e:
-        if isinstance(e, urllib.error.HTTPError):  # Check if it's an HTTPError (likely from Pytube's internal requests)
-            error_code_for_response = 9000 + e.code  # Create a custom acrCode based on HTTP status
-            if e.code == 400:
-                logging.error(f"HTTP Error 400 (Bad Request) from YouTube for {youtube_url}: {str(e)}", exc_info=True)
-                return jsonify(
-                    {'error': f'YouTube API Bad Request (HTTP 400): {str(e)}', 'acrCode': error_code_for_response,
-                     'acrResponse': str(e)}), 502
-            elif e.code == 403:
-                logging.error(f"HTTP Error 403 (Forbidden) from YouTube for {youtube_url}: {str(e)}", exc_info=True)
-                return jsonify(
-                    {'error': f'YouTube API Forbidden (HTTP 403): {str(e)}', 'acrCode': error_code_for_response,
-                     'acrResponse': str(e)}), 502
-            elif e.code == 429:
-                logging.error(f"HTTP Error 429 (Too Many Requests) from YouTube for {youtube_url}: {str(e)}",
-                              exc_info=True)
-                return jsonify({'error': f'Rate limited by YouTube (HTTP 429). Please try again later.',
-                                'acrCode': error_code_for_response, 'acrResponse': str(e)}), 429
-            else:  # Other HTTP errors from Pytube
-                logging.error(f"HTTP Error {e.code} from YouTube for {youtube_url}: {str(e)}", exc_info=True)
-                return jsonify(
-                    {'error': f'YouTube API Error (HTTP {e.code}): {str(e)}', 'acrCode': error_code_for_response,
-                     'acrResponse': str(e)}), 502
-
-        # Fallback for other non-HTTPError, non-Pytube specific exceptions
         logging.error(f"General error processing {youtube_url}: {str(e)}", exc_info=True)
         return jsonify({'error': f'Server error: {str(e)}', 'acrCode': 9500, 'acrResponse': str(e)}), 500
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logging.info(f"Temporary file {temp_file_path} deleted.")
-            except Exception as e_clean:
-                logging.error(f"Error deleting temporary file {temp_file_path}: {str(e_clean)}")
 
 
 @app.route('/')
@@ -183,4 +530,7 @@ def home():
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     is_production = os.environ.get('FLASK_ENV') == 'production' or os.environ.get('NODE_ENV') == 'production'
-    app.run(host='0.0.0.0', port=port, debug=not is_production)
\ No newline at end of file
+    if is_production:
+        # The dev server handles one request at a time; production runs under gunicorn's gevent workers (see Procfile).
+        raise SystemExit("Refusing to start the Flask development server in production. Use the Procfile command.")
+    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Import main without gevent's monkey patching (pytest has already loaded threading/ssl) and keep its caches out of
+# the working tree.
+os.environ.setdefault('GEVENT_MONKEY_PATCH', '0')
+os.environ.setdefault('ACR_CACHE_DIR', tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,21 @@
+import orjson
+import pytest
+from acrcloud.recognizer import ACRCloudStatusCode
+
+import main
+
+
+@pytest.mark.parametrize('result, transient', [
+    (ACRCloudStatusCode.get_result_error(3000, '<urlopen error timed out>'), True),
+    (ACRCloudStatusCode.get_result_error(3000, 'HTTP Error 503: Service Unavailable'), True),
+    (ACRCloudStatusCode.get_result_error(3000, 'HTTP Error 401: Unauthorized'), False),
+    (ACRCloudStatusCode.get_result_error(3000, 'HTTP Error 429: Too Many Requests'), False),
+    (orjson.dumps({'status': {'code': 1001, 'msg': 'No result'}}).decode(), False),
+    # A nested status must not be mistaken for the top-level one, whichever comes first
+    (orjson.dumps({'metadata': {'music': [{'status': {'code': 3000, 'msg': 'Http Error'}}]},
+                   'status': {'code': 0, 'msg': 'Success'}}).decode(), False),
+    (orjson.dumps({'metadata': {'music': [{'status': {'code': 0, 'msg': 'Success'}}]},
+                   'status': {'code': 3000, 'msg': 'Http Error:<urlopen error timed out>'}}).decode(), True),
+])
+def test_is_transient_acr_error(result, transient):
+    assert main.is_transient_acr_error(result) is transient
@@ -0,0 +1,94 @@
+import random
+import sqlite3
+import subprocess
+import time
+from contextlib import closing
+
+import pytest
+
+import main
+
+
+def make_fingerprint(seed, length=100):
+    rng = random.Random(seed)
+    return [rng.getrandbits(32) for _ in range(length)]
+
+
+@pytest.fixture
+def fingerprint_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'FINGERPRINT_DB_PATH', str(tmp_path / 'fingerprints.sqlite3'))
+    main.init_fingerprint_db()
+
+
+def test_bit_error_rate_identical():
+    fingerprint = make_fingerprint(1)
+    assert main.fingerprint_bit_error_rate(fingerprint, fingerprint) == 0
+
+
+def test_bit_error_rate_shifted():
+    fingerprint = make_fingerprint(1)
+    assert main.fingerprint_bit_error_rate(fingerprint[3:], fingerprint) == 0
+
+
+def test_bit_error_rate_unrelated():
+    assert main.fingerprint_bit_error_rate(make_fingerprint(1), make_fingerprint(2)) > main.FINGERPRINT_MAX_BER
+
+
+def test_find_fingerprint_match(fingerprint_db):
+    fingerprint = make_fingerprint(1)
+    main.store_fingerprint('aaaaaaaaaaa', fingerprint)
+    main.store_fingerprint('bbbbbbbbbbb', make_fingerprint(2))
+    assert main.find_fingerprint_match(fingerprint) == 'aaaaaaaaaaa'
+    assert main.find_fingerprint_match(fingerprint[3:]) == 'aaaaaaaaaaa'
+    assert main.find_fingerprint_match(make_fingerprint(3)) is None
+
+
+def test_lookup_prunes_fingerprints_without_cached_response(fingerprint_db):
+    fingerprint = make_fingerprint(1)
+    main.store_fingerprint('aaaaaaaaaaa', fingerprint)
+    main.acr_result_cache.delete('aaaaaaaaaaa')
+    assert main.lookup_fingerprint_response('ccccccccccc', fingerprint) is None
+    assert main.find_fingerprint_match(fingerprint) is None
+
+
+def test_lookup_falls_through_to_next_candidate(fingerprint_db):
+    fingerprint = make_fingerprint(1)
+    main.store_fingerprint('aaaaaaaaaaa', fingerprint)
+    main.store_fingerprint('bbbbbbbbbbb', fingerprint[:90] + make_fingerprint(2, 10))
+    main.acr_result_cache.delete('aaaaaaaaaaa')
+    main.acr_result_cache.set('bbbbbbbbbbb', {'matches': [], 'acrCode': 0, 'acrResponse': 'Success'})
+    response = main.lookup_fingerprint_response('ccccccccccc', fingerprint)
+    assert response == {'matches': [], 'acrCode': 0, 'acrResponse': 'Success'}
+    assert main.find_fingerprint_match(fingerprint) == 'bbbbbbbbbbb'
+
+
+def test_compute_fingerprint_accepts_signed_items(fingerprint_db, monkeypatch):
+    monkeypatch.setattr(main, 'FPCALC_PATH', 'fpcalc')
+    monkeypatch.setattr(main.subprocess, 'run', lambda *args, **kwargs: subprocess.CompletedProcess(
+        args, 0, stdout=b'DURATION=12\nFINGERPRINT=-1,5,-2147483648\n'))
+    fingerprint = main.compute_fingerprint(b'audio')
+    assert fingerprint == [0xFFFFFFFF, 5, 0x80000000]
+    main.store_fingerprint('aaaaaaaaaaa', fingerprint)
+    assert main.find_fingerprint_match(fingerprint) == 'aaaaaaaaaaa'
+
+
+def test_store_expires_old_fingerprints(fingerprint_db, monkeypatch):
+    fingerprint = make_fingerprint(1)
+    main.store_fingerprint('aaaaaaaaaaa', fingerprint)
+    later = time.time() + main.ACR_MATCH_CACHE_TTL + 1
+    monkeypatch.setattr(main.time, 'time', lambda: later)
+    main.store_fingerprint('bbbbbbbbbbb', make_fingerprint(2))
+    assert main.find_fingerprint_match(fingerprint) is None
+    with closing(sqlite3.connect(main.FINGERPRINT_DB_PATH)) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM fingerprint_items WHERE video_id = 'aaaaaaaaaaa'").fetchone() == (0,)
+
+
+def test_init_adds_created_at_to_existing_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'FINGERPRINT_DB_PATH', str(tmp_path / 'fingerprints.sqlite3'))
+    with closing(sqlite3.connect(main.FINGERPRINT_DB_PATH)) as connection, connection:
+        connection.execute('CREATE TABLE fingerprints (video_id TEXT PRIMARY KEY, fingerprint BLOB NOT NULL)')
+        connection.execute("INSERT INTO fingerprints VALUES ('aaaaaaaaaaa', x'00000000')")
+    main.init_fingerprint_db()
+    main.store_fingerprint('bbbbbbbbbbb', make_fingerprint(2))
+    with closing(sqlite3.connect(main.FINGERPRINT_DB_PATH)) as connection:
+        assert connection.execute('SELECT video_id FROM fingerprints').fetchall() == [('bbbbbbbbbbb',)]
@@ -0,0 +1,80 @@
+import orjson
+import pytest
+from yt_dlp.utils import DownloadError, ExtractorError, GeoRestrictedError
+
+import main
+
+AUDIO_FORMAT = {'format_id': '140', 'url': 'https://example.invalid/audio', 'ext': 'm4a', 'abr': 128}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, 'acr_recognizer', object())
+    monkeypatch.setattr(main, 'compute_fingerprint', lambda audio_data: None)
+    monkeypatch.setattr(main, 'download_audio_prefix', lambda audio_format, num_bytes: b'\0' * num_bytes)
+    main.acr_result_cache.clear()
+    main.unavailable_video_cache.clear()
+    main.audio_format_cache.clear()
+    return main.app.test_client()
+
+
+def process(client, video_id):
+    return client.post('/api/process-youtube-url', json={'url': f'https://www.youtube.com/watch?v={video_id}'})
+
+
+def test_status_is_read_from_top_level_only(client, monkeypatch):
+    # "status" objects also occur inside metadata items, and ACRCloud does not promise to serialize the top level first
+    acr_response = orjson.dumps({'metadata': {'music': [{'title': 'T', 'status': {'code': 0, 'msg': 'Success'}}]},
+                                 'status': {'code': 1001, 'msg': 'No result'}}).decode()
+    monkeypatch.setattr(main, 'recognize_audio', lambda audio_data: acr_response)
+    main.audio_format_cache['aaaaaaaaaaa'] = AUDIO_FORMAT
+
+    response = process(client, 'aaaaaaaaaaa')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'matches': [], 'acrCode': 1001, 'acrResponse': 'No result'}
+
+
+def raise_on_extract(monkeypatch, error):
+    class FailingYoutubeDL:
+        def extract_info(self, url, download=False):
+            raise DownloadError(f'ERROR: {error}', (type(error), error, None))
+
+    monkeypatch.setattr(main, 'ydl', FailingYoutubeDL())
+
+
+@pytest.mark.parametrize('error', [
+    ExtractorError('Video unavailable. This video has been removed by the uploader', expected=True),
+    ExtractorError("Private video. Sign in if you've been granted access to this video", expected=True),
+    ExtractorError('Join this channel to get access to members-only content like this video', expected=True),
+    ExtractorError('Sign in to confirm your age. This video may be inappropriate for some users.', expected=True),
+    GeoRestrictedError('The uploader has not made this video available in your country'),
+])
+def test_unavailable_video_is_negative_cached(client, monkeypatch, error):
+    raise_on_extract(monkeypatch, error)
+
+    response = process(client, 'bbbbbbbbbbb')
+
+    assert response.status_code == 404
+    assert response.get_json()['acrCode'] == 9001
+    assert 'bbbbbbbbbbb' in main.unavailable_video_cache
+
+
+@pytest.mark.parametrize('error, status_code, acr_code', [
+    (ExtractorError("Video unavailable. This content isn't available, try again later. Your account has been "
+                    "rate-limited by YouTube for up to an hour.", expected=True), 429, 9429),
+    (ExtractorError("This content isn't available, try again later.", expected=True), 429, 9429),
+    (ExtractorError("Sign in to confirm you're not a bot. Use --cookies-from-browser or --cookies for the "
+                    "authentication.", expected=True), 503, 9503),
+    (ExtractorError('YouTube is requiring a captcha challenge before playback', expected=True), 503, 9503),
+    (ExtractorError('Requested format is not available', expected=True), 500, 9002),
+    (ExtractorError('Video unavailable', expected=False), 500, 9002),
+])
+def test_throttling_and_other_errors_are_not_cached(client, monkeypatch, error, status_code, acr_code):
+    raise_on_extract(monkeypatch, error)
+
+    response = process(client, 'ccccccccccc')
+
+    assert response.status_code == status_code
+    assert response.get_json()['acrCode'] == acr_code
+    assert 'ccccccccccc' not in main.unavailable_video_cache
@@ -0,0 +1,45 @@
+import pytest
+
+import main
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    f'https://www.youtube.com/watch?v={VIDEO_ID}',
+    f'http://youtube.com/watch?v={VIDEO_ID}&t=42s',
+    f'www.youtube.com/watch?v={VIDEO_ID}',
+    f'https://m.youtube.com/watch?v={VIDEO_ID}',
+    f'https://music.youtube.com/watch?v={VIDEO_ID}&si=abc',
+    f'https://www.youtube.com/watch?app=desktop&v={VIDEO_ID}',
+    f'https://www.youtube.com/watch?list=PLx&index=2&v={VIDEO_ID}#t=1',
+    f'https://www.youtube.com/shorts/{VIDEO_ID}',
+    f'https://www.youtube.com/shorts/{VIDEO_ID}?feature=share',
+    f'https://www.youtube.com/embed/{VIDEO_ID}',
+    f'https://www.youtube.com/live/{VIDEO_ID}?si=abc',
+    f'https://youtu.be/{VIDEO_ID}',
+    f'https://youtu.be/{VIDEO_ID}?si=abc',
+    f'youtu.be/{VIDEO_ID}#t=10',
+])
+def test_accepted_urls(url):
+    url_match = main.YOUTUBE_URL_RE.fullmatch(url)
+    assert url_match is not None
+    assert url_match['vid'] == VIDEO_ID
+
+
+@pytest.mark.parametrize('url', [
+    f'https://www.youtube.com/watch?v={VIDEO_ID}Q',  # 12 characters
+    f'https://youtu.be/{VIDEO_ID}Q',
+    'https://www.youtube.com/watch?v=dQw4w9WgXc',  # 10 characters
+    f'https://www.youtube.com/watch?vv={VIDEO_ID}',
+    f'https://www.youtube.com/watch?list=PLx#v={VIDEO_ID}',  # v= in the fragment, not the query
+    f'https://www.youtube.com/watch?v={VIDEO_ID} extra',
+    f'https://www.notyoutube.com/watch?v={VIDEO_ID}',
+    f'https://youtube.com.example.com/watch?v={VIDEO_ID}',
+    f'https://example.com/youtube.com/watch?v={VIDEO_ID}',
+    f'https://vimeo.com/{VIDEO_ID}',
+    f'https://www.youtube.com/channel/{VIDEO_ID}',
+    f'ftp://www.youtube.com/watch?v={VIDEO_ID}',
+])
+def test_rejected_urls(url):
+    assert main.YOUTUBE_URL_RE.fullmatch(url) is None